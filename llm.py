@@ -1,22 +1,70 @@
 # backend/agents/llm_rule_agent_enhanced.py
 from __future__ import annotations
 
+import asyncio
+import collections
+import csv
+import functools
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
 import uuid
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, List, NamedTuple
 from datetime import datetime
 
-import pandas as pd
 from langchain_openai import AzureChatOpenAI
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.prompts import ChatPromptTemplate
+from tenacity import (
+    before_sleep_log,
+    retry,
+    retry_if_exception_type,
+    stop_after_attempt,
+    wait_random_exponential,
+)
+
+logger = logging.getLogger(__name__)
+
+# Only transient transport/quota failures are worth retrying; everything
+# else (bad credentials, content filters, …) fails straight through.
+try:
+    import openai
+    _RETRYABLE_ERRORS = (
+        openai.RateLimitError,
+        openai.APITimeoutError,
+        openai.APIConnectionError,
+        TimeoutError,
+        ConnectionError,
+    )
+except ImportError:
+    _RETRYABLE_ERRORS = (TimeoutError, ConnectionError)
+
+# orjson parses the 10-50KB batched responses several times faster than
+# the stdlib; fall back silently when it isn't installed.
+try:
+    import orjson
+
+    def _json_loads(s):
+        return orjson.loads(s)
+except ImportError:
+    _json_loads = json.loads
 
 # ─────────────── paths & dirs ───────────────
 BASE_DIR = Path(__file__).resolve().parent.parent
 RULE_DIR = BASE_DIR / "rule_outputs"
 RULE_DIR.mkdir(exist_ok=True)
+CACHE_DIR = RULE_DIR / "llm_cache"
+CACHE_DIR.mkdir(exist_ok=True)
 
 # ─────────────── default prompt ─────────────
+# Block types with nothing for the LLM to translate — passed through verbatim
+_TRIVIAL_TYPES = {"COMMENT", "LIBNAME", "INCLUDE"}
+_EMPTY_RE = re.compile(r"^\s*(run|quit)\s*;\s*$", re.IGNORECASE)
+
 DEFAULT_SYSTEM_PROMPT = (
     "You are an expert migration engineer.\n"
     "Convert the given SAS code block to **equivalent PySpark** "
@@ -38,14 +86,34 @@ PROMPT_TMPL = ChatPromptTemplate.from_messages(
     ]
 )
 
+BATCH_PROMPT_TMPL = ChatPromptTemplate.from_messages(
+    [
+        ("system", "{system_prompt}"),
+        (
+            "user",
+            "Convert each of the following SAS code blocks to PySpark.\n"
+            "Respond with ONE JSON object mapping every block id to its "
+            'converted PySpark code, e.g. {{"chunk_1": "<pyspark>"}}. '
+            "No other text.\n\n"
+            "{blocks}",
+        ),
+    ]
+)
+
 # ─────────── token counter ───────────
-def _count_tokens(model_name: str, text: str) -> int:
+@functools.lru_cache(maxsize=8)
+def _enc_for(model_name: str):
+    """Encoder construction loads vocab + BPE merges — build once per model."""
     try:
         import tiktoken
-        enc = tiktoken.encoding_for_model(model_name)
-        return len(enc.encode(text))
+        return tiktoken.encoding_for_model(model_name)
     except Exception:
-        return len(text.split())
+        return None
+
+@functools.lru_cache(maxsize=4096)
+def _count_tokens(model_name: str, text: str) -> int:
+    enc = _enc_for(model_name)
+    return len(enc.encode(text)) if enc else len(text.split())
 
 # ─────────── LLM init ───────────
 def _init_llm(provider: str, cred: Dict):
@@ -66,8 +134,133 @@ def _init_llm(provider: str, cred: Dict):
         )
     raise ValueError("Unsupported LLM provider")
 
+@functools.lru_cache(maxsize=8)
+def _init_llm_cached(provider: str, cred_key: tuple):
+    """One client per credential set: keeps HTTP sessions (and their
+    keep-alive sockets) alive across repeated workflow runs."""
+    return _init_llm(provider, dict(cred_key))
+
+# ─────────── result record ───────────
+class Record(NamedTuple):
+    """One converted chunk; field order matches the rule CSV columns."""
+    id: str
+    ok: bool
+    reason: str
+    input_sas_code: str
+    code: str
+    input_tokens: int
+    output_tokens: int
+    total_tokens: int
+
+# ─────────── response cache ───────────
+def _cache_key(system_prompt: str, code: str) -> str:
+    return hashlib.blake2b(
+        (system_prompt + "\x00" + code).encode("utf-8"), digest_size=16
+    ).hexdigest()
+
+def _cache_get(key: str):
+    path = CACHE_DIR / f"{key}.json"
+    if not path.exists():
+        return None
+    try:
+        return _json_loads(path.read_text(encoding="utf-8"))
+    except Exception:
+        return None
+
+def _cache_put(key: str, record: Dict):
+    try:
+        (CACHE_DIR / f"{key}.json").write_text(
+            json.dumps(record), encoding="utf-8"
+        )
+    except OSError:
+        pass  # cache is best-effort
+
+def _record_from_cache(blk: Dict, cached: Dict) -> "Record":
+    return Record(
+        id             = blk["id"],
+        ok             = cached.get("ok", True),
+        reason         = "Cache hit",
+        input_sas_code = blk["code"],
+        code           = cached.get("code", ""),
+        input_tokens   = cached.get("input_tokens", 0),
+        output_tokens  = cached.get("output_tokens", 0),
+        total_tokens   = cached.get("total_tokens", 0),
+    )
+
+# ─────────── rate limiting ───────────
+class _AsyncRateLimiter:
+    """Token bucket: at most `rate` acquisitions per `period` seconds."""
+
+    def __init__(self, rate: int, period: float = 60.0):
+        self.rate    = rate
+        self.period  = period
+        self._stamps = collections.deque()
+        self._lock   = asyncio.Lock()
+
+    async def acquire(self):
+        while True:
+            async with self._lock:
+                now = time.monotonic()
+                while self._stamps and now - self._stamps[0] >= self.period:
+                    self._stamps.popleft()
+                if len(self._stamps) < self.rate:
+                    self._stamps.append(now)
+                    return
+                wait = self.period - (now - self._stamps[0])
+            await asyncio.sleep(wait)
+
+_RPM_LIMITERS: Dict[int, _AsyncRateLimiter] = {}
+_TPM_WINDOW: collections.deque = collections.deque()  # (monotonic_ts, total_tokens)
+
+def _rpm_limiter(rate: int) -> _AsyncRateLimiter:
+    if rate not in _RPM_LIMITERS:
+        _RPM_LIMITERS[rate] = _AsyncRateLimiter(rate)
+    return _RPM_LIMITERS[rate]
+
+async def _await_tpm_budget(model_name: str, text: str, tpm_cap: int):
+    """Block until the estimated request fits in the per-minute token window."""
+    if not tpm_cap:
+        return
+    est = _count_tokens(model_name, text)
+    while True:
+        now = time.monotonic()
+        while _TPM_WINDOW and now - _TPM_WINDOW[0][0] >= 60.0:
+            _TPM_WINDOW.popleft()
+        if not _TPM_WINDOW or sum(t for _, t in _TPM_WINDOW) + est <= tpm_cap:
+            return
+        await asyncio.sleep(60.0 - (now - _TPM_WINDOW[0][0]))
+
+def _note_tokens(total: int):
+    if not total:
+        return
+    # Prune on append too: with no TPM cap configured _await_tpm_budget
+    # returns before its pruning loop, and the window would otherwise
+    # grow by one entry per call for the life of the process.
+    now = time.monotonic()
+    while _TPM_WINDOW and now - _TPM_WINDOW[0][0] >= 60.0:
+        _TPM_WINDOW.popleft()
+    _TPM_WINDOW.append((now, total))
+
 # ─────────── core converter ───────────
-def _convert_chunk(llm, blk: Dict, system_prompt: str, retry: bool = False) -> Dict:
+@retry(
+    retry        = retry_if_exception_type(_RETRYABLE_ERRORS),
+    wait         = wait_random_exponential(min=1, max=30),
+    stop         = stop_after_attempt(5),
+    reraise      = True,
+    before_sleep = before_sleep_log(logger, logging.WARNING),
+)
+async def _invoke_with_backoff(llm, rendered):
+    return await llm.ainvoke(rendered)
+
+async def _convert_chunk(llm, blk: Dict, system_prompt: str,
+                         rpm: int = 500, tpm: int = 0,
+                         use_cache: bool = True) -> Record:
+    key = _cache_key(system_prompt, blk["code"])
+    if use_cache:
+        cached = _cache_get(key)
+        if cached is not None:
+            return _record_from_cache(blk, cached)
+
     rendered = PROMPT_TMPL.format_prompt(
         system_prompt = system_prompt,
         chunk_id      = blk["id"],
@@ -76,7 +269,11 @@ def _convert_chunk(llm, blk: Dict, system_prompt: str, retry: bool = False) -> D
     ).to_messages()
 
     try:
-        resp   = llm.predict_messages(rendered)
+        await _rpm_limiter(rpm).acquire()
+        await _await_tpm_budget(
+            getattr(llm, "model_name", "gpt-4o"), rendered[-1].content, tpm
+        )
+        resp   = await _invoke_with_backoff(llm, rendered)
         output = resp.content.strip()
         if not output:
             raise ValueError("LLM returned empty result")
@@ -89,27 +286,147 @@ def _convert_chunk(llm, blk: Dict, system_prompt: str, retry: bool = False) -> D
             in_tok  = _count_tokens(getattr(llm, "model_name", "gpt-4o"), in_txt)
             out_tok = _count_tokens(getattr(llm, "model_name", "gpt-4o"), output)
 
-        return {
-            "id":   blk["id"],
-            "ok":   True,
-            "code": output,
-            "reason": "",
-            "input_tokens":  in_tok,
-            "output_tokens": out_tok,
-            "total_tokens":  in_tok + out_tok,
-        }
+        _note_tokens(in_tok + out_tok)
+        record = Record(
+            id             = blk["id"],
+            ok             = True,
+            reason         = "",
+            input_sas_code = blk["code"],
+            code           = output,
+            input_tokens   = in_tok,
+            output_tokens  = out_tok,
+            total_tokens   = in_tok + out_tok,
+        )
+        if use_cache:
+            _cache_put(key, record._asdict())
+        return record
     except Exception as exc:
-        if not retry:
-            return _convert_chunk(llm, blk, system_prompt, retry=True)  # one retry
-        return {
-            "id":   blk["id"],
-            "ok":   False,
-            "code": f"# LLM ERROR: {exc}",
-            "reason": str(exc),
-            "input_tokens": 0,
-            "output_tokens": 0,
-            "total_tokens": 0,
-        }
+        return Record(
+            id             = blk["id"],
+            ok             = False,
+            reason         = str(exc),
+            input_sas_code = blk["code"],
+            code           = f"# LLM ERROR: {exc}",
+            input_tokens   = 0,
+            output_tokens  = 0,
+            total_tokens   = 0,
+        )
+
+# ─────────── batch converter ───────────
+_JSON_OBJ_RE = re.compile(r"\{.*\}", re.DOTALL)
+
+def _parse_json_response(text: str):
+    """Pull the JSON object out of a (possibly fenced) model response."""
+    m = _JSON_OBJ_RE.search(text)
+    if not m:
+        return None
+    try:
+        data = _json_loads(m.group(0))
+    except Exception:
+        return None
+    return data if isinstance(data, dict) else None
+
+def _pack_batches(blks: List[Dict], model_name: str,
+                  batch_size: int, token_budget: int = 3000) -> List[List[Dict]]:
+    batches, cur, cur_tok = [], [], 0
+    for blk in blks:
+        tok = _count_tokens(model_name, blk["code"])
+        if cur and (len(cur) >= batch_size or cur_tok + tok > token_budget):
+            batches.append(cur)
+            cur, cur_tok = [], 0
+        cur.append(blk)
+        cur_tok += tok
+    if cur:
+        batches.append(cur)
+    return batches
+
+async def _convert_batch(llm, blks: List[Dict], system_prompt: str,
+                         rpm: int = 500, tpm: int = 0,
+                         use_cache: bool = True) -> List[Record]:
+    """Convert several blocks in one completion; fall back per-block on bad JSON."""
+    if len(blks) == 1:
+        return [await _convert_chunk(llm, blks[0], system_prompt, rpm, tpm, use_cache)]
+
+    blocks_text = "\n\n".join(
+        f"### block id={b['id']} type={b['type']} ###\n{b['code']}" for b in blks
+    )
+    rendered = BATCH_PROMPT_TMPL.format_prompt(
+        system_prompt=system_prompt, blocks=blocks_text
+    ).to_messages()
+    model_name = getattr(llm, "model_name", "gpt-4o")
+
+    data = None
+    try:
+        await _rpm_limiter(rpm).acquire()
+        await _await_tpm_budget(model_name, rendered[-1].content, tpm)
+        resp = await _invoke_with_backoff(llm, rendered)
+        data = _parse_json_response(resp.content)
+    except Exception:
+        data = None
+
+    done: Dict[str, Record] = {}
+    leftovers: List[Dict] = []
+    for blk in blks:
+        output = (data or {}).get(blk["id"])
+        if not isinstance(output, str) or not output.strip():
+            leftovers.append(blk)
+            continue
+        in_tok  = _count_tokens(model_name, blk["code"])
+        out_tok = _count_tokens(model_name, output)
+        _note_tokens(in_tok + out_tok)
+        record = Record(
+            id             = blk["id"],
+            ok             = True,
+            reason         = "",
+            input_sas_code = blk["code"],
+            code           = output.strip(),
+            input_tokens   = in_tok,
+            output_tokens  = out_tok,
+            total_tokens   = in_tok + out_tok,
+        )
+        if use_cache:
+            _cache_put(_cache_key(system_prompt, blk["code"]), record._asdict())
+        done[blk["id"]] = record
+
+    if leftovers:
+        singles = await asyncio.gather(*[
+            _convert_chunk(llm, blk, system_prompt, rpm, tpm, use_cache)
+            for blk in leftovers
+        ])
+        for rec in singles:
+            done[rec.id] = rec
+
+    return [done[b["id"]] for b in blks]
+
+# ─────────── event loop ───────────
+_LOOP: asyncio.AbstractEventLoop = None
+
+def _run_async(coro):
+    """Run `coro` to completion on one long-lived background loop.
+
+    asyncio.run would build and tear down a loop per node invocation,
+    but the lru-cached clients hold httpx connection pools bound to the
+    loop they first ran under — reusing a pooled keep-alive socket from
+    a later run fails with \"Event loop is closed\". A single persistent
+    loop keeps the cached clients and their sockets valid across runs.
+    """
+    global _LOOP
+    if _LOOP is None or _LOOP.is_closed():
+        _LOOP = asyncio.new_event_loop()
+        threading.Thread(
+            target=_LOOP.run_forever, name="llm-rule-loop", daemon=True
+        ).start()
+    return asyncio.run_coroutine_threadsafe(coro, _LOOP).result()
+
+# ─────────── bounded fan-out ───────────
+async def _gather_bounded(coros, max_concurrency: int):
+    sem = asyncio.Semaphore(max_concurrency)
+
+    async def _run(coro):
+        async with sem:
+            return await coro
+
+    return await asyncio.gather(*[_run(c) for c in coros])
 
 # ─────────── LangGraph node ───────────
 def llm_rule_node(state: Dict) -> Dict:
@@ -121,37 +438,72 @@ def llm_rule_node(state: Dict) -> Dict:
     system_prompt   = state.get("system_prompt", DEFAULT_SYSTEM_PROMPT)
     dry_run         = state.get("dry_run", False)
 
-    llm = _init_llm(provider, cred)
-    trivial = set()
+    llm = _init_llm_cached(provider, tuple(sorted(cred.items())))
+    trivial = {t.upper() for t in state.get("trivial_types", _TRIVIAL_TYPES)}
+    max_concurrency = int(state.get("max_concurrency", 8))
+    rpm = int(cred.get("rpm", 500))
+    tpm = int(cred.get("tpm", 0))  # 0 → no TPM throttling
+    use_cache = bool(state.get("use_cache", True))
 
-    records = []
-    sas_lookup = {b["id"]: b["code"] for b in ast_blocks}
+    # Parse each id's numeric suffix once and write results straight into
+    # their final slot — no post-run sort, no separate code lookup table.
+    suffixes = {b["id"]: int(b["id"].rsplit("_", 1)[-1]) for b in ast_blocks}
+    slot_of = {bid: i for i, bid in enumerate(sorted(suffixes, key=suffixes.get))}
+    records: List[Record] = [None] * len(ast_blocks)
+    pending = []
 
     for blk in ast_blocks:
-        if blk["type"].lower() in trivial:
-            records.append({
-                "id": blk["id"],
-                "ok": True,
-                "code": f"# {blk['type'].upper()} skipped\n",
-                "reason": "Skipped",
-                "input_tokens": 0,
-                "output_tokens": 0,
-                "total_tokens": 0,
-            })
+        if blk["type"].upper() in trivial or _EMPTY_RE.match(blk["code"]):
+            records[slot_of[blk["id"]]] = Record(
+                id             = blk["id"],
+                ok             = True,
+                reason         = "Skipped",
+                input_sas_code = blk["code"],
+                code           = f"# {blk['type'].upper()} passthrough\n{blk['code']}",
+                input_tokens   = 0,
+                output_tokens  = 0,
+                total_tokens   = 0,
+            )
         elif dry_run:
-            records.append({
-                "id": blk["id"],
-                "ok": True,
-                "code": "# DRY RUN - SKIPPED",
-                "reason": "Dry run mode",
-                "input_tokens": 0,
-                "output_tokens": 0,
-                "total_tokens": 0,
-            })
+            records[slot_of[blk["id"]]] = Record(
+                id             = blk["id"],
+                ok             = True,
+                reason         = "Dry run mode",
+                input_sas_code = blk["code"],
+                code           = "# DRY RUN - SKIPPED",
+                input_tokens   = 0,
+                output_tokens  = 0,
+                total_tokens   = 0,
+            )
         else:
-            records.append(_convert_chunk(llm, blk, system_prompt))
+            # Resolve cache hits before batching — the batch path only
+            # writes the cache, so hits left in `pending` would be
+            # re-sent to the model inside a batch completion.
+            cached = _cache_get(_cache_key(system_prompt, blk["code"])) if use_cache else None
+            if cached is not None:
+                records[slot_of[blk["id"]]] = _record_from_cache(blk, cached)
+            else:
+                pending.append(blk)
 
-    records.sort(key=lambda r: int(r["id"].split("_")[-1]))
+    batch_size = int(state.get("batch_size", 8))
+    if pending:
+        if batch_size > 1 and len(pending) > 1:
+            model_name = getattr(llm, "model_name", "gpt-4o")
+            batches = _pack_batches(pending, model_name, batch_size)
+            results = _run_async(_gather_bounded(
+                [_convert_batch(llm, batch, system_prompt, rpm, tpm, use_cache)
+                 for batch in batches],
+                max_concurrency,
+            ))
+            converted = [rec for batch_records in results for rec in batch_records]
+        else:
+            converted = _run_async(_gather_bounded(
+                [_convert_chunk(llm, blk, system_prompt, rpm, tpm, use_cache)
+                 for blk in pending],
+                max_concurrency,
+            ))
+        for rec in converted:
+            records[slot_of[rec.id]] = rec
 
     csv_path = (
         Path(state["rule_csv"])
@@ -160,23 +512,18 @@ def llm_rule_node(state: Dict) -> Dict:
     )
     state["rule_csv"] = str(csv_path)
 
-    df = pd.DataFrame([
-        {
-            "id": r["id"],
-            "success": r["ok"],
-            "reason": r.get("reason", ""),
-            "input_sas_code": sas_lookup.get(r["id"], ""),
-            "output_pyspark_code": r["code"],
-            "input_tokens": r["input_tokens"],
-            "output_tokens": r["output_tokens"],
-            "total_tokens": r["total_tokens"]
-        }
-        for r in records
-    ])
-    df.to_csv(csv_path, index=False)
-
-    successes  = [r for r in records if r["ok"]]
-    failed_ids = [r["id"] for r in records if not r["ok"]]
+    # Write rows straight through csv.writer — no DataFrame intermediate,
+    # no full-file buffer; only the CSV artifact is needed downstream.
+    with open(csv_path, "w", newline="", buffering=1 << 20, encoding="utf-8") as fh:
+        writer = csv.writer(fh)
+        writer.writerow([
+            "id", "success", "reason", "input_sas_code",
+            "output_pyspark_code", "input_tokens", "output_tokens", "total_tokens",
+        ])
+        writer.writerows(records)  # Record field order matches the header
+
+    successes  = [r for r in records if r.ok]
+    failed_ids = [r.id for r in records if not r.ok]
 
     meta = {
         "timestamp": datetime.utcnow().isoformat(),
@@ -1,5 +1,8 @@
+import os
+import re
 import uuid
 import logging
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
 from typing import List, Optional, Any
 
@@ -38,7 +41,9 @@ grammar = """
     %ignore WS
 """
 
-parser = Lark(grammar, start="start", parser="lalr")
+# cache=True serializes the LALR tables to disk (keyed on a hash of the
+# grammar) so re-imports skip the EBNF parse + table construction.
+parser = Lark(grammar, start="start", parser="lalr", cache=True)
 
 class SASNodeTransformer(Transformer):
     def macro(self, children):
@@ -88,47 +93,125 @@ class SASNodeTransformer(Transformer):
 
 transformer = SASNodeTransformer()
 
-@dataclass
+# ─── regex fast path ───
+# The grammar above is nearly regular (every rule bottoms out in /[^;]+/),
+# so the common flat forms can be scanned with one compiled alternation,
+# skipping tree construction + transformer traversal entirely. Chunks the
+# scanner cannot fully cover fall back to the Lark parser.
+_SAS_BLOCK_RE = re.compile(
+    r"(?P<macro>%macro\s+(?P<macro_name>\w+)\s*;(?P<macro_body>.*?)%mend\s*;)"
+    r"|(?P<datastep>data\s+(?P<data_name>\w+)\s*;(?P<data_body>.*?)run\s*;)"
+    r"|(?P<proc>proc\s+(?P<proc_name>\w+)\s*;(?P<proc_body>.*?)run\s*;)"
+    r'|(?P<libname>libname\s+(?P<lib_name>\w+)\s+"(?P<lib_path>[^"]*)"\s*;)'
+    r'|(?P<include>%include\s+"(?P<inc_file>[^"]*)"\s*;)'
+    r"|(?P<comment>\*(?P<comment_text>[^;]+);)",
+    re.IGNORECASE | re.DOTALL,
+)
+
+_ASSIGN_RE = re.compile(r"(?P<var>[a-zA-Z_]\w*)\s*=\s*(?P<value>.+)", re.DOTALL)
+_DECL_RE = re.compile(r"(length|attrib|format)\b", re.IGNORECASE)
+
+def _fast_statements(body: str) -> List[dict]:
+    stmts = []
+    for raw in body.split(";"):
+        raw = raw.strip()
+        if not raw:
+            continue
+        m = _ASSIGN_RE.fullmatch(raw)
+        if m:
+            stmts.append({"type": "ASSIGN", "var": m.group("var"),
+                          "value": m.group("value").strip()})
+        elif _DECL_RE.match(raw):
+            stmts.append({"type": "DECLARATION", "raw": raw})
+        else:
+            stmts.append({"type": "STATEMENT", "raw": raw})
+    return stmts
+
+def _fast_parse(code: str) -> Optional[List[dict]]:
+    """Scan `code` with the combined alternation; None when coverage is incomplete."""
+    out = []
+    pos = 0
+    for m in _SAS_BLOCK_RE.finditer(code):
+        if code[pos:m.start()].strip():
+            return None  # unrecognized text between blocks → let Lark decide
+        if m.group("macro"):
+            inner = _fast_parse(m.group("macro_body"))
+            if inner is None:
+                return None
+            out.append({"type": "MACRO", "name": m.group("macro_name"),
+                        "blocks": inner})
+        elif m.group("datastep"):
+            out.append({"type": "DATASTEP", "name": m.group("data_name"),
+                        "statements": _fast_statements(m.group("data_body"))})
+        elif m.group("proc"):
+            out.append({"type": "PROC", "name": m.group("proc_name"),
+                        "statements": _fast_statements(m.group("proc_body"))})
+        elif m.group("libname"):
+            out.append({"type": "LIBNAME", "lib": m.group("lib_name"),
+                        "path": m.group("lib_path")})
+        elif m.group("include"):
+            out.append({"type": "INCLUDE", "file": m.group("inc_file")})
+        else:
+            out.append({"type": "COMMENT", "text": m.group("comment_text").strip()})
+        pos = m.end()
+    if code[pos:].strip():
+        return None
+    return out
+
+@dataclass(slots=True)
 class ASTBlock:
     id: str
     type: str
     code: str
     ast: Optional[Any] = None
 
+def _parse_one(chunk: dict) -> ASTBlock:
+    block_type = chunk["type"].upper()
+    try:
+        ast = _fast_parse(chunk["code"])
+        if ast is None:
+            tree = parser.parse(chunk["code"])
+            ast = transformer.transform(tree)
+        return ASTBlock(
+            id=chunk["id"],
+            type=block_type,
+            code=chunk["code"],
+            ast=ast
+        )
+    except UnexpectedInput:
+        return ASTBlock(
+            id=chunk["id"],
+            type=block_type,
+            code=chunk["code"]
+        )
+
 def parse_node(state: dict) -> dict:
     logging.info("🔍 Starting Parse Node")
 
     sas_code: str = state.get("sas_code", "")
     raw_chunks = chunk_sas_code_v3(sas_code)
-    parsed_blocks: List[ASTBlock] = []
 
-    for chunk in raw_chunks:
-        block_type = chunk["type"].upper()
-        try:
-            tree = parser.parse(chunk["code"])
-            ast = transformer.transform(tree)
-            block = ASTBlock(
-                id=chunk["id"],
-                type=block_type,
-                code=chunk["code"],
-                ast=ast
-            )
-        except UnexpectedInput:
-            block = ASTBlock(
-                id=chunk["id"],
-                type=block_type,
-                code=chunk["code"]
-            )
-        parsed_blocks.append(block)
-
-    save_chunks_to_csv([{
+    # Parsing is pure CPU and the chunks are independent, so fan out
+    # across processes to bypass the GIL; pool startup isn't worth it
+    # for a handful of chunks.
+    if len(raw_chunks) < 4:
+        parsed_blocks: List[ASTBlock] = [_parse_one(c) for c in raw_chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=os.cpu_count()) as ex:
+            parsed_blocks = list(ex.map(_parse_one, raw_chunks, chunksize=8))
+
+    # One materialization, shared by the CSV dump and the state. The ast
+    # trees stay off this path: they don't serialize usefully into CSV
+    # cells and no downstream node reads them from state.
+    as_dicts = [{
         "id": b.id,
         "type": b.type,
         "code": b.code
-    } for b in parsed_blocks], "ast_blocks_latest.csv")
+    } for b in parsed_blocks]
+    save_chunks_to_csv(as_dicts, "ast_blocks_latest.csv")
 
     return {
         **state,
-        "ast_blocks": [b.__dict__ for b in parsed_blocks],
+        "ast_blocks": as_dicts,
         "logs": state.get("logs", []) + [f"Parse: {len(parsed_blocks)} blocks"]
     }
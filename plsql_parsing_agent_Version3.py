@@ -1,19 +1,39 @@
+import functools
 import streamlit as st
 import pandas as pd
 import sqlparse
 from typing import List
 import re
 
+# Compiled once at import — recompiling per call costs ~100µs each on
+# every Streamlit rerun.
+_BLOCK_RE = re.compile(
+    r'((?:(?:CREATE\s+(?:OR\s+REPLACE\s+)?(?:FUNCTION|PROCEDURE|PACKAGE|TRIGGER)[\s\S]*?END\s*;)|'
+    r'(?:DECLARE[\s\S]*?END\s*;)|'
+    r'(?:BEGIN[\s\S]*?END\s*;)|'
+    r'(?:[^;]+;)))',
+    re.IGNORECASE
+)
+_BEGIN_SPLIT_RE = re.compile(r'(?i)(?=BEGIN)')
+_COMMENT_LINE_RE = re.compile(r'^\s*(--.*)?$')
+
+def _comment_only(b):
+    """True when a block holds nothing but -- comments / blank lines.
+
+    Checked line by line: a single whole-block regex with nested
+    repetition backtracks exponentially on comment runs followed by
+    indented code.
+    """
+    return all(_COMMENT_LINE_RE.match(l) for l in b.splitlines())
+
+@functools.lru_cache(maxsize=256)
+def _parse_sql_cached(text):
+    """sqlparse re-tokenizes identical text in chunking and token summaries."""
+    return sqlparse.parse(text)
+
 def _regex_chunk_blocks(plsql_code):
     code = plsql_code.replace('\r\n', '\n').replace('\r', '\n')
-    block_re = re.compile(
-        r'((?:(?:CREATE\s+(?:OR\s+REPLACE\s+)?(?:FUNCTION|PROCEDURE|PACKAGE|TRIGGER)[\s\S]*?END\s*;)|'
-        r'(?:DECLARE[\s\S]*?END\s*;)|'
-        r'(?:BEGIN[\s\S]*?END\s*;)|'
-        r'(?:[^;]+;)))',
-        re.IGNORECASE
-    )
-    block_matches = block_re.findall(code)
+    block_matches = _BLOCK_RE.findall(code)
     blocks = []
     for block in block_matches:
         block = block.strip()
@@ -22,14 +42,14 @@ def _regex_chunk_blocks(plsql_code):
     return blocks
 
 def _ast_chunk_blocks(plsql_code, max_chunk_size=1200):
-    statements = sqlparse.parse(plsql_code)
+    statements = _parse_sql_cached(plsql_code)
     blocks = []
     for stmt in statements:
         stmt_str = str(stmt).strip()
         if not stmt_str:
             continue
         if len(stmt_str) > max_chunk_size:
-            inner_blocks = re.split(r'(?i)(?=BEGIN)', stmt_str)
+            inner_blocks = _BEGIN_SPLIT_RE.split(stmt_str)
             for ib in inner_blocks:
                 ib = ib.strip()
                 if not ib:
@@ -58,7 +78,7 @@ def _ast_chunk_blocks(plsql_code, max_chunk_size=1200):
     for b in blocks:
         if not b.strip():
             continue
-        if all(l.strip().startswith('--') or not l.strip() for l in b.split('\n')):
+        if _comment_only(b):
             continue
         final_blocks.append(b)
     return final_blocks
@@ -74,18 +94,22 @@ def split_plsql_into_blocks(plsql_code, max_chunk_size=1200):
             all_blocks.append(block)
     cleaned_blocks = []
     temp = []
+    temp_len = 0
     for b in all_blocks:
         if not b.strip():
             continue
         if len(b) < 180:
             temp.append(b)
-            if sum(len(x) for x in temp) > 300:
+            temp_len += len(b) + 1
+            if temp_len > 300:
                 cleaned_blocks.append('\n'.join(temp))
                 temp = []
+                temp_len = 0
         else:
             if temp:
                 cleaned_blocks.append('\n'.join(temp))
                 temp = []
+                temp_len = 0
             cleaned_blocks.append(b)
     if temp:
         cleaned_blocks.append('\n'.join(temp))
@@ -106,7 +130,7 @@ def split_plsql_into_blocks(plsql_code, max_chunk_size=1200):
                 final_blocks.append('\n'.join(buff))
         else:
             final_blocks.append(b)
-    final_blocks = [b for b in final_blocks if b.strip() and not all(l.strip().startswith('--') or not l.strip() for l in b.split('\n'))]
+    final_blocks = [b for b in final_blocks if b.strip() and not _comment_only(b)]
     return final_blocks
 
 def get_block_type(block):
@@ -135,7 +159,7 @@ def get_block_type(block):
         return "OTHER"
 
 def get_token_summary(block):
-    stmts = sqlparse.parse(block)
+    stmts = _parse_sql_cached(block)
     summary = []
     for stmt in stmts:
         tokens = [t for t in stmt.flatten() if not t.is_whitespace]
@@ -145,6 +169,16 @@ def get_token_summary(block):
         ])
     return summary
 
+# Streamlit reruns the whole script on every widget interaction;
+# cache the pure computations so only the render path re-executes.
+@st.cache_data(show_spinner=False)
+def _split_blocks_cached(sql_code: str, max_chunk_size: int):
+    return split_plsql_into_blocks(sql_code, max_chunk_size=max_chunk_size)
+
+@st.cache_data(show_spinner=False)
+def _token_summary_cached(block: str):
+    return get_token_summary(block)
+
 def example_plsql():
     return """CREATE OR REPLACE PROCEDURE update_salary IS
   v_count NUMBER := 0;
@@ -203,7 +237,7 @@ else:
 if sql_code:
     st.markdown("#### Original PL/SQL Script:")
     st.code(sql_code, language="sql")
-    blocks = split_plsql_into_blocks(sql_code, max_chunk_size=chunk_size)
+    blocks = _split_blocks_cached(sql_code, chunk_size)
     st.success(f"Detected {len(blocks)} logical blocks.")
 
     block_types = []
@@ -235,7 +269,7 @@ if sql_code:
         st.write(f"**Lines:** {num_lines[i]} &nbsp;|&nbsp; **Chars:** {num_chars[i]}")
         if show_ast:
             st.markdown("<details><summary>Show AST Tokens</summary>", unsafe_allow_html=True)
-            token_summary = get_token_summary(block)
+            token_summary = _token_summary_cached(block)
             for stmt_idx, tokens in enumerate(token_summary):
                 st.markdown(f"<b>Statement {stmt_idx+1}:</b>", unsafe_allow_html=True)
                 for t in tokens:
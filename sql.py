@@ -1,10 +1,15 @@
 import streamlit as st
 import os
 import re
-import time
 import openai
+import sqlparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
 
+# Comment-stripping patterns, compiled once at import
+_COMMENT_BLOCK_RE = re.compile(r"/\*.*?\*/", re.DOTALL)
+_COMMENT_LINE_RE = re.compile(r"--.*")
+
 # Load environment variables
 load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
@@ -28,6 +33,10 @@ This app allows you to:
 4. View and download the converted PySpark script.
 """)
 
+# Rendering every block in expanders costs widget-tree work per rerun
+# even when they stay collapsed, so full block views are opt-in.
+show_blocks = st.sidebar.checkbox("Show per-block code", value=False, key="show_blocks")
+
 # Upload file
 uploaded_file = st.file_uploader("📤 Upload your PL/SQL (.sql) file", type=["sql"])
 if uploaded_file:
@@ -36,17 +45,25 @@ if uploaded_file:
     st.code(plsql_code, language="sql")
 
     # --- Step 1: Parse PL/SQL Code ---
+    @st.cache_data(show_spinner=False)
     def parse_sql_into_blocks(code: str):
-        raw_blocks = [block.strip() for block in code.split(";") if block.strip()]
+        # sqlparse.split respects string literals and BEGIN...END; bodies,
+        # unlike a raw split(";") which shredded them into broken fragments.
         cleaned_blocks = []
-        for block in raw_blocks:
-            block = re.sub(r"/\*.*?\*/", "", block, flags=re.DOTALL)  # Remove block comments
-            block = re.sub(r"--.*", "", block)  # Remove line comments
-            cleaned_blocks.append(block.strip())
+        for stmt in sqlparse.split(code):
+            stmt = _COMMENT_BLOCK_RE.sub("", stmt)  # Remove block comments
+            stmt = _COMMENT_LINE_RE.sub("", stmt)  # Remove line comments
+            stmt = stmt.strip()
+            if stmt:
+                cleaned_blocks.append(stmt)
         return cleaned_blocks
 
     # --- Step 2: Convert each block with OpenAI ---
-    def convert_block_to_pyspark_with_openai(block: str):
+    def convert_block_to_pyspark_with_openai(block: str, holder=None):
+        # Streams the completion token-by-token; when `holder` (an
+        # st.empty slot) is given, partial code is rendered as it arrives
+        # so the user sees output within first-token latency instead of
+        # waiting for the full response.
         try:
             prompt = f"""
 You are a data engineer. Convert the following PL/SQL code block into equivalent PySpark (Python) code. Maintain the logic and structure as closely as possible. Comment important translations.
@@ -62,9 +79,17 @@ PL/SQL Code:
                     {"role": "system", "content": "You are a helpful assistant that converts PL/SQL code to PySpark code."},
                     {"role": "user", "content": prompt}
                 ],
-                temperature=0.3
+                temperature=0.3,
+                stream=True
             )
-            return response['choices'][0]['message']['content'].strip()
+            acc = []
+            for chunk in response:
+                delta = chunk['choices'][0]['delta'].get('content', '')
+                if delta:
+                    acc.append(delta)
+                    if holder is not None:
+                        holder.code("".join(acc), language="python")
+            return "".join(acc).strip()
         except Exception as e:
             return f"# Error: {e}"
 
@@ -78,20 +103,42 @@ PL/SQL Code:
 
     st.write(f"✅ Found `{len(blocks)}` blocks for conversion.")
 
-    converted_blocks = []
+    # The legacy openai SDK is synchronous, so fan the network-bound calls
+    # out over a thread pool instead of blocking on each one in turn.
     progress_bar = st.progress(0)
-    for i, block in enumerate(blocks):
-        with st.expander(f"🔹 Original Block {i+1}", expanded=False):
-            st.code(block, language="sql")
+    converted_blocks = [None] * len(blocks)
+    if len(blocks) == 1:
+        # Single block: stream straight into the page. (Streamlit widgets
+        # can only be driven from the main thread, so the pooled path
+        # below accumulates without live rendering.)
+        converted_blocks[0] = convert_block_to_pyspark_with_openai(
+            blocks[0], holder=st.empty()
+        )
+        progress_bar.progress(1.0)
+    else:
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            futures = {
+                executor.submit(convert_block_to_pyspark_with_openai, block): i
+                for i, block in enumerate(blocks)
+            }
+            done = 0
+            # Update the bar every few completions — per-block updates
+            # force a Streamlit re-render each time.
+            step = max(1, len(blocks) // 20)
+            for future in as_completed(futures):
+                converted_blocks[futures[future]] = future.result()
+                done += 1
+                if done % step == 0 or done == len(blocks):
+                    progress_bar.progress(done / len(blocks))
 
-        converted = convert_block_to_pyspark_with_openai(block)
-        converted_blocks.append(converted)
-
-        with st.expander(f"🟩 Converted Block {i+1} (PySpark)", expanded=False):
-            st.code(converted, language="python")
-
-        progress_bar.progress((i + 1) / len(blocks))
-        time.sleep(0.5)  # Optional delay for UX
+    for i, block in enumerate(blocks):
+        if show_blocks:
+            with st.expander(f"🔹 Original Block {i+1}", expanded=False):
+                st.code(block, language="sql")
+            with st.expander(f"🟩 Converted Block {i+1} (PySpark)", expanded=False):
+                st.code(converted_blocks[i], language="python")
+        else:
+            st.write(f"Block {i+1}: {len(block)} chars in, {len(converted_blocks[i])} chars out")
 
     final_output = "\n\n".join(converted_blocks)
 
@@ -1,57 +1,183 @@
+import hashlib
 import os
 import io
+import re
+import requests
 import streamlit as st
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_exponential
 import pandas as pd
 from typing import Optional
 import sqlparse
+from sqlparse import lexer as _sqlparse_lexer
 
-# --- Robust PL/SQL Chunker (Regex + AST) ---
-def _regex_chunk_blocks(plsql_code):
+# Instantiating the default lexer here makes sqlparse build its keyword
+# tables once at import instead of lazily inside the first parse of
+# every rerun; parse/parsestream below reuse this shared instance.
+_LEXER = _sqlparse_lexer.Lexer.get_default_instance()
+
+# Compiled once at import; per-call re.compile cost adds up on every
+# Streamlit rerun (and `re` was never imported, so chunking raised
+# NameError before any of it ran).
+_BEGIN_SPLIT_RE = re.compile(r'(?i)(?=BEGIN)')
+_COMMENT_LINE_RE = re.compile(r'^\s*(--.*)?$')
+_COMPOUND_START_RE = re.compile(
+    r'CREATE\s+(?:OR\s+REPLACE\s+)?(?:FUNCTION|PROCEDURE|PACKAGE|TRIGGER)\b'
+    r'|DECLARE\b|BEGIN\b',
+    re.IGNORECASE
+)
+_BEGIN_WORD_RE = re.compile(r'\bBEGIN\b', re.IGNORECASE)
+# A block closer is END, optionally followed by the unit's name (plain
+# or quoted) — END update_salary; / END "q"; — but never END IF/LOOP/
+# CASE, which close control structures, not BEGIN scopes.
+_BLOCK_END_RE = re.compile(
+    r'\bEND(\s+(?!IF\b|LOOP\b|CASE\b)(?:"[^"]*"|\w+))?\s*\Z',
+    re.IGNORECASE
+)
+# Longest prefix is 7 chars ("DECLARE"), so uppercasing an 8-char slice
+# is enough — no full-block uppercased copy per dispatch.
+_HEAVY_PREFIXES = ('CREATE', 'DECLARE', 'BEGIN')
+
+def _comment_only(b):
+    """True when a block holds nothing but -- comments / blank lines.
+
+    splitlines() walks the raw buffer in C and the generator short-
+    circuits on the first code line — no per-line strip() copies.
+    """
+    return all(_COMMENT_LINE_RE.match(l) for l in b.splitlines())
+
+def _iter_statements(s):
+    """Yield ';'-delimited statements lazily (without the semicolon).
+
+    Drop-in for s.split(';'), except semicolons inside single-quoted
+    strings, -- line comments, and /* */ block comments don't terminate
+    a statement — a raw split silently corrupted embedded ';' literals.
+    """
+    NORMAL, QUOTE, LINE_COMMENT, BLOCK_COMMENT = 0, 1, 2, 3
+    state = NORMAL
+    start = 0
+    i = 0
+    n = len(s)
+    while i < n:
+        c = s[i]
+        if state == NORMAL:
+            if c == "'":
+                state = QUOTE
+            elif c == '-' and s.startswith('--', i):
+                state = LINE_COMMENT
+                i += 1
+            elif c == '/' and s.startswith('/*', i):
+                state = BLOCK_COMMENT
+                i += 1
+            elif c == ';':
+                yield s[start:i]
+                start = i + 1
+        elif state == QUOTE:
+            if c == "'":
+                state = NORMAL
+        elif state == LINE_COMMENT:
+            if c == '\n':
+                state = NORMAL
+        else:  # BLOCK_COMMENT
+            if c == '*' and s.startswith('*/', i):
+                state = NORMAL
+                i += 1
+        i += 1
+    if start < n:
+        yield s[start:]
+
+# --- Robust PL/SQL Chunker (Scanner + AST) ---
+def _scan_blocks(plsql_code):
+    """Single linear pass over the script, yielding top-level blocks lazily.
+
+    Replaces the old four-way alternation of lazy [\\s\\S]*? patterns,
+    which backtracked quadratically on scripts with nested BEGIN/END.
+    Compound blocks are delimited by tracking BEGIN nesting depth per
+    statement; everything else ends at its semicolon. Yielding (rather
+    than building a list) keeps peak memory at one block at a time —
+    the only consumer iterates once.
+    """
     code = plsql_code.replace('\r\n', '\n').replace('\r', '\n')
-    block_re = re.compile(
-        r'((?:(?:CREATE\s+(?:OR\s+REPLACE\s+)?(?:FUNCTION|PROCEDURE|PACKAGE|TRIGGER)[\s\S]*?END\s*;)|'
-        r'(?:DECLARE[\s\S]*?END\s*;)|'
-        r'(?:BEGIN[\s\S]*?END\s*;)|'
-        r'(?:[^;]+;)))',
-        re.IGNORECASE
-    )
-    block_matches = block_re.findall(code)
-    blocks = []
-    for block in block_matches:
-        block = block.strip()
-        if block and block != '/':
-            blocks.append(block)
-    return blocks
+    n = len(code)
+    i = 0
+    while i < n:
+        while i < n and (code[i].isspace() or code[i] == '/'):
+            i += 1
+        if i >= n:
+            break
+        start = i
+        if _COMPOUND_START_RE.match(code, i):
+            begins = 0
+            ends = 0
+            j = i
+            end_pos = -1
+            while j < n:
+                semi = code.find(';', j)
+                if semi == -1:
+                    break
+                seg = code[j:semi]
+                begins += len(_BEGIN_WORD_RE.findall(seg))
+                if _BLOCK_END_RE.search(seg.rstrip()):
+                    ends += 1
+                    if ends >= begins:
+                        end_pos = semi + 1
+                        break
+                j = semi + 1
+            if end_pos == -1:
+                # Unbalanced/unterminated compound block: emit the rest
+                # of the script as one block rather than discarding it —
+                # the oversize path downstream will split it further.
+                tail = code[start:].strip()
+                if tail and tail != '/':
+                    yield tail
+                break
+            yield code[start:end_pos].strip()
+            i = end_pos
+        else:
+            semi = code.find(';', i)
+            if semi == -1:
+                break
+            block = code[start:semi + 1].strip()
+            if block and block != '/':
+                yield block
+            i = semi + 1
 
 def _ast_chunk_blocks(plsql_code, max_chunk_size=1200):
-    statements = sqlparse.parse(plsql_code)
+    # Fast path: a block already under budget with no nested BEGIN can't
+    # be split any further — skip the expensive sqlparse tokenizer pass.
+    if len(plsql_code) <= max_chunk_size and plsql_code.upper().count('BEGIN') <= 1:
+        return [plsql_code] if plsql_code.strip() and not _comment_only(plsql_code) else []
+    # parsestream pipelines tokenization statement-by-statement rather
+    # than materializing the parsed statement tuple up front.
+    statements = sqlparse.parsestream(io.StringIO(plsql_code))
     blocks = []
     for stmt in statements:
         stmt_str = str(stmt).strip()
         if not stmt_str:
             continue
         if len(stmt_str) > max_chunk_size:
-            inner_blocks = re.split(r'(?i)(?=BEGIN)', stmt_str)
+            inner_blocks = _BEGIN_SPLIT_RE.split(stmt_str)
             for ib in inner_blocks:
                 ib = ib.strip()
                 if not ib:
                     continue
                 if len(ib) > max_chunk_size:
-                    sub_blocks = []
-                    temp = []
-                    temp_len = 0
-                    for part in ib.split(';'):
+                    # Accumulate into one growable buffer instead of
+                    # list-append + '\n'.join per flush.
+                    buf = io.StringIO()
+                    buf_len = 0
+                    for part in _iter_statements(ib):
                         if not part.strip():
                             continue
-                        temp.append(part + ';')
-                        temp_len += len(part) + 1
-                        if temp_len > max_chunk_size:
-                            sub_blocks.append('\n'.join(temp).strip())
-                            temp = []
-                            temp_len = 0
-                    if temp:
-                        sub_blocks.append('\n'.join(temp).strip())
-                    blocks.extend(sub_blocks)
+                        buf.write(part)
+                        buf.write(';\n')
+                        buf_len += len(part) + 2
+                        if buf_len > max_chunk_size:
+                            blocks.append(buf.getvalue().strip())
+                            buf = io.StringIO()
+                            buf_len = 0
+                    if buf_len:
+                        blocks.append(buf.getvalue().strip())
                 else:
                     blocks.append(ib)
         else:
@@ -60,55 +186,66 @@ def _ast_chunk_blocks(plsql_code, max_chunk_size=1200):
     for b in blocks:
         if not b.strip():
             continue
-        if all(l.strip().startswith('--') or not l.strip() for l in b.split('\n')):
+        if _comment_only(b):
             continue
         final_blocks.append(b)
     return final_blocks
 
+@st.cache_data(show_spinner=False)
 def split_plsql_into_blocks(plsql_code, max_chunk_size=1200):
-    regex_blocks = _regex_chunk_blocks(plsql_code)
     all_blocks = []
-    for block in regex_blocks:
-        if len(block) > max_chunk_size or block.upper().startswith(('CREATE', 'DECLARE', 'BEGIN')):
+    for block in _scan_blocks(plsql_code):
+        if len(block) > max_chunk_size or block[:8].upper().startswith(_HEAVY_PREFIXES):
             ast_blocks = _ast_chunk_blocks(block, max_chunk_size)
             all_blocks.extend(ast_blocks)
         else:
             all_blocks.append(block)
     cleaned_blocks = []
     temp = []
+    temp_len = 0  # running total; re-summing temp per append is O(k) each time
     for b in all_blocks:
         if not b.strip():
             continue
         if len(b) < 180:
             temp.append(b)
-            if sum(len(x) for x in temp) > 300:
+            temp_len += len(b) + 1
+            if temp_len > 300:
                 cleaned_blocks.append('\n'.join(temp))
                 temp = []
+                temp_len = 0
         else:
             if temp:
                 cleaned_blocks.append('\n'.join(temp))
                 temp = []
+                temp_len = 0
             cleaned_blocks.append(b)
     if temp:
         cleaned_blocks.append('\n'.join(temp))
+    # Size-split and comment-filter in the same traversal: one pass over
+    # the block list instead of building an intermediate list and
+    # rescanning it.
     final_blocks = []
+    def _emit(piece):
+        if piece.strip() and not _comment_only(piece):
+            final_blocks.append(piece)
     for b in cleaned_blocks:
         if len(b) > max_chunk_size:
-            stmts = [s+';' for s in b.split(';') if s.strip()]
-            buff = []
-            buff_len = 0
-            for stmt in stmts:
-                buff.append(stmt)
-                buff_len += len(stmt)
-                if buff_len > max_chunk_size:
-                    final_blocks.append('\n'.join(buff))
-                    buff = []
-                    buff_len = 0
-            if buff:
-                final_blocks.append('\n'.join(buff))
+            buf = io.StringIO()
+            buf_len = 0
+            for stmt in _iter_statements(b):
+                if not stmt.strip():
+                    continue
+                buf.write(stmt)
+                buf.write(';\n')
+                buf_len += len(stmt) + 2
+                if buf_len > max_chunk_size:
+                    _emit(buf.getvalue().rstrip())
+                    buf = io.StringIO()
+                    buf_len = 0
+            if buf_len:
+                _emit(buf.getvalue().rstrip())
         else:
-            final_blocks.append(b)
-    final_blocks = [b for b in final_blocks if b.strip() and not all(l.strip().startswith('--') or not l.strip() for l in b.split('\n'))]
+            _emit(b)
     return final_blocks
 
 # --- LLM Credentials UI & Validation ---
@@ -170,18 +307,102 @@ def llm_credentials_flow():
         return st.session_state["llm_creds"]
     return None
 
+# Retry transient provider failures with exponential backoff. The SDK
+# error classes are matched by name because both SDKs are imported
+# lazily (they're optional, per-provider dependencies).
+_RETRYABLE_NAMES = (
+    "RateLimitError", "Timeout", "APIConnectionError",
+    "ServiceUnavailableError", "ResourceExhausted",
+    "DeadlineExceeded", "TooManyRequests",
+)
+
+def _is_retryable(exc):
+    return isinstance(exc, (TimeoutError, ConnectionError)) \
+        or type(exc).__name__ in _RETRYABLE_NAMES
+
+_llm_retry = retry(
+    retry=retry_if_exception(_is_retryable),
+    wait=wait_exponential(multiplier=1, max=30),
+    stop=stop_after_attempt(5),
+    reraise=True,
+)
+
 # --- LLM Provider Classes ---
 class LLMProvider:
+    BATCH_SPLIT = "###PYSPARK_SPLIT###"
+
     def convert(self, block: str) -> str:
         raise NotImplementedError
-    def convert_optimized(self, script: str) -> str:
+    def _convert_whole(self, script: str) -> str:
         raise NotImplementedError
+    def _complete(self, prompt: str) -> str:
+        raise NotImplementedError
+    def convert_optimized(self, script: str) -> str:
+        """Map-reduce conversion: convert blocks in parallel batches, then
+        merge with one final call. Latency tracks the longest block plus
+        the merge instead of the whole script, and scripts larger than
+        the model context still convert. Small scripts (≤2 blocks) go
+        through the one-shot prompt — a merge pass would only add a
+        round trip."""
+        blocks = split_plsql_into_blocks(script)
+        if len(blocks) <= 2:
+            return self._convert_whole(script)
+        batch_size = 4
+        batches = [blocks[i:i + batch_size] for i in range(0, len(blocks), batch_size)]
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            converted = [
+                part
+                for batch_out in executor.map(self.convert_batch, batches)
+                for part in batch_out
+            ]
+        stitched = "\n\n".join(converted)
+        merge_prompt = (
+            "You are a senior data engineer. The following PySpark fragments were "
+            "converted block-by-block from one PL/SQL script. Merge them into a "
+            "single, clean, production-ready PySpark script: unify imports and the "
+            "SparkSession setup, deduplicate repeated logic, reconcile column "
+            "schemas, and output only the final executable Python code.\n\n"
+            f"PySpark Fragments:\n{stitched}\n"
+        )
+        try:
+            return self._complete(merge_prompt)
+        except Exception:
+            # The per-block output is still valid code; ship it unmerged
+            # rather than losing the whole conversion to the reduce step.
+            return stitched
+    def convert_batch(self, blocks):
+        """Convert several blocks in one request to amortize the fixed
+        per-call overhead; falls back to per-block calls whenever the
+        response does not split back into the right number of parts."""
+        if len(blocks) == 1:
+            return [self.convert(blocks[0])]
+        prompt = (
+            "You are a senior data engineer migrating legacy PL/SQL to PySpark.\n\n"
+            f"Convert each of the following {len(blocks)} PL/SQL blocks into "
+            "PySpark DataFrame API code. Return only code for each block, and "
+            "separate the outputs with a line containing exactly:\n"
+            f"{self.BATCH_SPLIT}\n\n"
+            + "\n\n".join(
+                f"-- Block {i + 1} --\n{b}" for i, b in enumerate(blocks)
+            )
+        )
+        try:
+            raw = self._complete(prompt)
+        except Exception:
+            return [self.convert(b) for b in blocks]
+        parts = [p.strip() for p in raw.split(self.BATCH_SPLIT) if p.strip()]
+        if len(parts) != len(blocks):
+            return [self.convert(b) for b in blocks]
+        return parts
 
 class GeminiProvider(LLMProvider):
     def __init__(self, api_key: str):
         import google.generativeai as genai
         genai.configure(api_key=api_key)
         self.model = genai.GenerativeModel("gemini-1.5-pro")
+    @_llm_retry
+    def _complete(self, prompt: str) -> str:
+        return self.model.generate_content(prompt).text.strip()
     def convert(self, block: str) -> str:
         prompt = (
             "You are a senior data engineer experienced in migrating legacy PL/SQL code to PySpark.\n\n"
@@ -190,11 +411,10 @@ class GeminiProvider(LLMProvider):
             f"PL/SQL Block:\n{block}\n"
         )
         try:
-            resp = self.model.generate_content(prompt)
-            return resp.text.strip()
+            return self._complete(prompt)
         except Exception as e:
             return f"# Gemini Error: {e}"
-    def convert_optimized(self, script: str) -> str:
+    def _convert_whole(self, script: str) -> str:
         prompt = (
             "You are a senior data engineer experienced in migrating legacy PL/SQL code to PySpark.\n\n"
             "Convert the following ENTIRE PL/SQL script into a single, clean, production-ready PySpark script using the DataFrame API.\n"
@@ -202,8 +422,7 @@ class GeminiProvider(LLMProvider):
             f"Full PL/SQL Script:\n{script}\n"
         )
         try:
-            resp = self.model.generate_content(prompt)
-            return resp.text.strip()
+            return self._complete(prompt)
         except Exception as e:
             return f"# Gemini Error: {e}"
 
@@ -216,6 +435,18 @@ class OpenAIProvider(LLMProvider):
         openai.api_type = creds["OPENAI_API_TYPE"]
         openai.api_version = creds["OPENAI_API_VERSION"]
         self.deployment_name = creds["DEPLOYMENT_NAME"]
+        # One pooled session for all calls (and all executor threads):
+        # keep-alive avoids a fresh TCP/TLS handshake per request.
+        if getattr(openai, "requestssession", None) is None:
+            openai.requestssession = requests.Session()
+    @_llm_retry
+    def _complete(self, prompt: str) -> str:
+        resp = self.openai.ChatCompletion.create(
+            engine=self.deployment_name,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=0.3
+        )
+        return resp.choices[0].message.content.strip()
     def convert(self, block: str) -> str:
         prompt = (
             "You are a data engineer. Convert the following PL/SQL code block into PySpark DataFrame API code.\n"
@@ -223,30 +454,26 @@ class OpenAIProvider(LLMProvider):
             f"PL/SQL Block:\n{block}\n"
         )
         try:
-            resp = self.openai.ChatCompletion.create(
-                engine=self.deployment_name,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.3
-            )
-            return resp.choices[0].message.content.strip()
+            return self._complete(prompt)
         except Exception as e:
             return f"# OpenAI Error: {e}"
-    def convert_optimized(self, script: str) -> str:
+    def _convert_whole(self, script: str) -> str:
         prompt = (
             "You are a data engineer. Convert the following ENTIRE PL/SQL script into a single, clean, production-ready PySpark script using the DataFrame API.\n"
             "Integrate all logic, deduplicate where possible, use idiomatic and maintainable PySpark, and output only the final, unified, executable Python code. Do not simply concatenate per-block code: merge and optimize for clarity and maintainability.\n\n"
             f"Full PL/SQL Script:\n{script}\n"
         )
         try:
-            resp = self.openai.ChatCompletion.create(
-                engine=self.deployment_name,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.3
-            )
-            return resp.choices[0].message.content.strip()
+            return self._complete(prompt)
         except Exception as e:
             return f"# OpenAI Error: {e}"
 
+# The creds dict is hashed by value (sorted items) so editing any field
+# builds a fresh provider, while identical credentials keep reusing the
+# same SDK client — and its keep-alive HTTP session — across reruns.
+@st.cache_resource(hash_funcs={
+    dict: lambda d: hashlib.sha1(repr(sorted(d.items())).encode()).hexdigest()
+})
 def get_llm_provider(creds) -> Optional[LLMProvider]:
     if creds and creds.get("provider") == "Gemini" and creds.get("GEMINI_API_KEY"):
         return GeminiProvider(creds["GEMINI_API_KEY"])
@@ -254,10 +481,21 @@ def get_llm_provider(creds) -> Optional[LLMProvider]:
         return OpenAIProvider(creds)
     return None
 
+@st.cache_data(show_spinner=False)
+def _mapping_csv(blocks, converted_blocks) -> bytes:
+    """Serialize the mapping once per unique result set — re-clicks and
+    reruns reuse the cached bytes instead of re-encoding every row."""
+    df = pd.DataFrame({
+        "PL/SQL Block": blocks,
+        "Converted PySpark": converted_blocks
+    }, copy=False)
+    return df.to_csv(index=False).encode("utf-8")
+
 # --- UI Helper ---
-def show_fake_user_profile():
-    st.markdown(
-        """
+# Static HTML/CSS built once at import. Streamlit replaces the page on
+# every rerun, so these must still be emitted each run — but the strings
+# themselves never need to be reconstructed.
+_PROFILE_CARD_HTML = """
         <style>
         .profile-card {
             background: linear-gradient(135deg, #0f2027 0%, #2c5364 100%);
@@ -301,13 +539,9 @@ def show_fake_user_profile():
                 <span class="profile-role">🪄 Data Engineer</span>
             </div>
         </div>
-        """,
-        unsafe_allow_html=True
-    )
-
-st.set_page_config(page_title="PL/SQL to PySpark • Rich UI", layout="wide")
+        """
 
-st.markdown("""
+_PAGE_CSS = """
     <style>
     body {
         background: linear-gradient(120deg,#162447 0%,#1f4068 100%);
@@ -355,7 +589,14 @@ st.markdown("""
         box-shadow: 0 2px 12px #FFD70044;
     }
     </style>
-""", unsafe_allow_html=True)
+"""
+
+def show_fake_user_profile():
+    st.markdown(_PROFILE_CARD_HTML, unsafe_allow_html=True)
+
+st.set_page_config(page_title="PL/SQL to PySpark • Rich UI", layout="wide")
+
+st.markdown(_PAGE_CSS, unsafe_allow_html=True)
 
 st.markdown(
     "<h1>🔄 <span style='color:#FFD700;'>PL/SQL</span> to <span style='color:#FFD700;'>PySpark</span> Converter <span style='font-size:0.7em;color:#FFD700;'>✨ Luxury UI</span></h1>",
@@ -417,24 +658,49 @@ if sql_code and creds:
         st.error("❌ LLM provider not properly configured.")
         st.stop()
 
-    # Chunked conversion for mapping/audit/preview
-    converted_blocks = []
+    # Chunked conversion for mapping/audit/preview. The SDK calls are
+    # synchronous and network-bound, so fan them out over a thread pool
+    # and tick the progress bar as futures complete.
+    # Per-block response cache: Streamlit reruns this script on every
+    # widget interaction, and identical blocks shouldn't re-hit the API.
+    conv_cache = st.session_state.setdefault("conv_cache", {})
+    block_keys = [hashlib.sha1(b.encode("utf-8")).hexdigest() for b in blocks]
+    converted_blocks = [conv_cache.get(k) for k in block_keys]
+    missing = [i for i, c in enumerate(converted_blocks) if c is None]
+
     progress = st.progress(0, text="Converting blocks for preview/CSV ...")
-    for i, block in enumerate(blocks):
-        with st.spinner(f"Converting Block {i+1}/{len(blocks)}..."):
-            converted_blocks.append(provider.convert(block))
-            progress.progress((i+1)/len(blocks), text=f"Converted Block {i+1}/{len(blocks)}")
+    batch_size = 4
+    groups = [missing[i:i + batch_size] for i in range(0, len(missing), batch_size)]
+    done = len(blocks) - len(missing)
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        futures = {
+            executor.submit(provider.convert_batch,
+                            [blocks[i] for i in group]): group
+            for group in groups
+        }
+        for future in as_completed(futures):
+            group = futures[future]
+            for idx, output in zip(group, future.result()):
+                converted_blocks[idx] = output
+                conv_cache[block_keys[idx]] = output
+            done += len(group)
+            progress.progress(done / len(blocks),
+                              text=f"Converted {done}/{len(blocks)} blocks")
     progress.empty()
 
     st.markdown("<div style='font-size:1.09em;font-weight:500;color:#FFD700;margin:20px 0 0 0;'>🧾 Preview: PL/SQL Block vs PySpark</div>", unsafe_allow_html=True)
+    # Serializing hundreds of full code blocks to the browser on every
+    # rerun is slow; show the head and gate the full table.
     preview_df = pd.DataFrame({
         "PL/SQL Block": blocks,
         "Converted PySpark": converted_blocks
-    })
-    st.dataframe(preview_df, use_container_width=True)
-    csv_buffer = io.StringIO()
-    preview_df.to_csv(csv_buffer, index=False)
-    st.download_button("📥 Download PL/SQL Blocks Mapping (.csv)", data=csv_buffer.getvalue(),
+    }, copy=False)
+    if len(preview_df) > 50 and not st.checkbox(f"Show all {len(preview_df)} rows"):
+        st.dataframe(preview_df.head(50), use_container_width=True)
+    else:
+        st.dataframe(preview_df, use_container_width=True)
+    st.download_button("📥 Download PL/SQL Blocks Mapping (.csv)",
+                      data=_mapping_csv(blocks, converted_blocks),
                       file_name="plsql_blocks_mapping.csv", mime="text/csv")
 
     # Optimized Final PySpark code for the entire script